@@ -1,9 +1,25 @@
+import hashlib
+import json
 import streamlit as st
 import pandas as pd
 import numpy as np
 import folium
-from folium.plugins import MarkerCluster, FastMarkerCluster
-from streamlit_folium import st_folium
+from folium.plugins import MarkerCluster
+from folium.elements import JSCSSMixin
+from branca.element import MacroElement
+from jinja2 import Template
+import streamlit.components.v1 as components
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; coordinate_mask falls back to NumPy
+    njit = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; MarkerData falls back to json
+    orjson = None
 
 # ---------------- Page config & style ----------------
 st.set_page_config(page_title="Geospatial Location Visualizer", page_icon="🌍", layout="wide")
@@ -17,16 +33,57 @@ st.markdown("""
 
 # ---------------- Helpers ----------------
 def validate_coordinates(lat, lon):
+    """Scalar check for a single lat/lon pair; parse_csv validates whole columns at once."""
     try:
         lat = float(lat); lon = float(lon)
         return (-90 <= lat <= 90) and (-180 <= lon <= 180)
     except Exception:
         return False
 
-@st.cache_data(show_spinner=False)
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _coordinate_mask_numba(lat, lon, out):
+        for i in prange(lat.size):
+            la = lat[i]; lo = lon[i]
+            # NaN fails every comparison, so it is rejected without an explicit check
+            out[i] = (la >= -90) and (la <= 90) and (lo >= -180) and (lo <= 180)
+
+def coordinate_mask(lat, lon):
+    """Boolean mask of valid coordinates for float64 arrays (NaN or out of range -> False)."""
+    if njit is None:
+        return (lat >= -90) & (lat <= 90) & (lon >= -180) & (lon <= 180)
+    out = np.empty(lat.size, dtype=np.bool_)
+    _coordinate_mask_numba(lat, lon, out)
+    return out
+
+def upload_cache_key(file):
+    """Key an upload on its name, size and a digest of its bytes, not on the widget object."""
+    return (file.name, file.size, hashlib.blake2b(file.getvalue(), digest_size=16).hexdigest())
+
+# 6-decimal coordinate text, formatted in parse_csv from the float64 values
+LAT_TEXT, LON_TEXT = "_latitude_text", "_longitude_text"
+
+@st.cache_resource(show_spinner=False, hash_funcs={UploadedFile: upload_cache_key})
 def parse_csv(file):
-    """Read a CSV and return (valid_df, valid_count, invalid_count, postal_col, name_col, lat_col, lon_col)."""
-    df = pd.read_csv(file)
+    """
+    Read a CSV and return
+    (valid_df, valid_count, invalid_count, postal_col, name_col, lat_col, lon_col, postal_counts),
+    where postal_counts is the value_counts of the postal codes (as strings) in first-appearance order.
+    Cached as a shared resource rather than pickled per rerun, so callers must not mutate the results.
+    """
+    try:
+        df = pd.read_csv(file, engine="pyarrow", dtype_backend="pyarrow")
+    except ValueError:  # pyarrow rejects ragged rows that the C engine pads with NaN
+        file.seek(0)
+        df = pd.read_csv(file, dtype_backend="pyarrow")
+    # pyarrow keeps repeated header names; rename them like the C engine does (lat, lat.1, ...)
+    if df.columns.has_duplicates:
+        seen = {}
+        cols = []
+        for c in df.columns:
+            cols.append(f"{c}.{seen[c]}" if c in seen else c)
+            seen[c] = seen.get(c, 0) + 1
+        df.columns = cols
 
     # Detect lat/lon columns
     lat_col = lon_col = None
@@ -35,24 +92,25 @@ def parse_csv(file):
         if lat_col is None and any(t in lc for t in ["lat","latitude"]): lat_col = c
         if lon_col is None and any(t in lc for t in ["lon","long","longitude","lng"]): lon_col = c
     if lat_col is None or lon_col is None:
-        nums = df.select_dtypes(include=[np.number]).columns.tolist()
+        # select_dtypes(np.number) doesn't match Arrow-backed numeric dtypes
+        nums = [c for c in df.columns
+                if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
         if len(nums) >= 2:
             lat_col, lon_col = nums[:2]
         else:
             # no usable coords
-            return pd.DataFrame(), 0, len(df), None, None, None, None
+            return pd.DataFrame(), 0, len(df), None, None, None, None, pd.Series(dtype="int64")
 
     # Coerce & validate
-    tmp = df.copy()
-    tmp["__lat"] = pd.to_numeric(tmp[lat_col], errors="coerce")
-    tmp["__lon"] = pd.to_numeric(tmp[lon_col], errors="coerce")
-    mask = (
-        tmp["__lat"].notna() & tmp["__lon"].notna()
-        & tmp["__lat"].between(-90, 90) & tmp["__lon"].between(-180, 180)
-    )
-    valid = tmp.loc[mask].copy()
-    valid.rename(columns={"__lat":"latitude","__lon":"longitude"}, inplace=True)
-    valid.drop(columns=["__lat","__lon"], inplace=True, errors="ignore")
+    lat = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(np.float64, na_value=np.nan)
+    lon = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(np.float64, na_value=np.nan)
+    mask = coordinate_mask(lat, lon)
+    # float32 halves the stored/metrics columns; popup text and marker positions come from the
+    # float64 values via the text columns, since float32 can't hold 6 decimals beyond |x| ~ 8
+    valid = df.loc[mask].assign(**{
+        "latitude": lat[mask].astype(np.float32), "longitude": lon[mask].astype(np.float32),
+        LAT_TEXT: _coord_text(lat[mask]), LON_TEXT: _coord_text(lon[mask]),
+    })
 
     # Detect postal & name columns
     postal_candidates = [c for c in valid.columns if any(t in c.lower()
@@ -61,86 +119,229 @@ def parse_csv(file):
     name_candidates = [c for c in valid.columns if c.lower() in ["name","title","label","location_name"]]
     name_col = name_candidates[0] if name_candidates else None
 
-    return valid, int(mask.sum()), int(len(df) - mask.sum()), postal_col, name_col, lat_col, lon_col
-
-def popup_html(row, postal_col=None, name_col=None):
-    parts = ["<div class='cluster-popup'>", "<b>📍 Location Details</b><br>"]
-    if name_col and name_col in row and pd.notna(row[name_col]):
-        parts.append(f"<b>Name:</b> {row[name_col]}<br>")
-    parts.append(f"<b>Latitude:</b> {row['latitude']:.6f}<br>")
-    parts.append(f"<b>Longitude:</b> {row['longitude']:.6f}<br>")
-    if postal_col and postal_col in row and pd.notna(row[postal_col]):
-        parts.append(f"<b>Postal Code:</b> {row[postal_col]}<br>")
-    if "state" in row and pd.notna(row["state"]):   parts.append(f"<b>State:</b> {row['state']}<br>")
-    if "city"  in row and pd.notna(row["city"]):    parts.append(f"<b>City:</b> {row['city']}<br>")
-    if "address" in row and pd.notna(row["address"]): parts.append(f"<b>Address:</b> {row['address']}<br>")
-    parts.append("</div>")
-    return "".join(parts)
-
-def tooltip_text(row, postal_col=None, name_col=None, idx=0):
+    # Counted once here (cached) so reruns only merge two small count tables
+    postal_counts = (valid[postal_col].dropna().astype(str).value_counts(sort=False)
+                     if postal_col else pd.Series(dtype="int64"))
+
+    return valid, int(mask.sum()), int(len(df) - mask.sum()), postal_col, name_col, lat_col, lon_col, postal_counts
+
+def _optional_field(df, col, prefix="", suffix=""):
+    """
+    prefix + value + suffix for every row of df, or "" where col is missing/NaN.
+    Each distinct value is formatted once and rows share that string via the categorical codes.
+    """
+    # An all-empty column is read as null[pyarrow], which Categorical rejects
+    if not col or col not in df.columns or not df[col].notna().any():
+        return ""
+    cats = pd.Categorical(df[col])
+    # NaN has code -1, which picks the trailing ""
+    text = np.append((prefix + cats.categories.astype(str) + suffix).to_numpy(dtype=object), "")
+    return pd.Series(text[cats.codes], index=df.index)
+
+def _coord_text(values):
+    # .6f text for a float64 coordinate array, formatted once per distinct value like
+    # _optional_field; repeated locations are common.
+    codes, uniques = pd.factorize(values)
+    text = np.array(["{:.6f}".format(v) for v in uniques], dtype=object)
+    return text[codes]
+
+def payload_coords(text):
+    """
+    Marker payload coordinates parsed back from the 6-decimal text columns, so the map gets
+    the same float64 values the popups show (-122.419416, not a float32 approximation).
+    """
+    codes, uniques = pd.factorize(np.asarray(text))
+    return np.asarray(uniques, dtype=np.float64)[codes]
+
+def combined_mean(col, *frames):
+    """Mean of col across frames from per-frame sums/lengths, without concatenating them."""
+    frames = [f for f in frames if not f.empty]
+    n = sum(len(f) for f in frames)
+    # accumulate in float64; coordinates are stored as float32
+    return sum(f[col].to_numpy().sum(dtype=np.float64) for f in frames) / n if n else float("nan")
+
+def popup_html(df, postal_col=None, name_col=None):
+    """Popup HTML for every row of df, built column-wise rather than per marker."""
+    return (
+        "<div class='cluster-popup'><b>📍 Location Details</b><br>"
+        + _optional_field(df, name_col, "<b>Name:</b> ", "<br>")
+        + "<b>Latitude:</b> " + df[LAT_TEXT] + "<br>"
+        + "<b>Longitude:</b> " + df[LON_TEXT] + "<br>"
+        + _optional_field(df, postal_col, "<b>Postal Code:</b> ", "<br>")
+        + _optional_field(df, "state", "<b>State:</b> ", "<br>")
+        + _optional_field(df, "city", "<b>City:</b> ", "<br>")
+        + _optional_field(df, "address", "<b>Address:</b> ", "<br>")
+        + "</div>"
+    )
+
+def tooltip_text(df, postal_col=None, name_col=None):
     """
     Always show Lat/Lon and Postal Code (if available) on hover.
     Name (if present) is prefixed on the first line.
     """
-    name_part = ""
-    if name_col and name_col in row and pd.notna(row[name_col]):
-        name_part = f"{row[name_col]}\n"
-    lat_val = row.get("latitude", None)
-    lon_val = row.get("longitude", None)
-    latlon_part = f"Lat: {float(lat_val):.6f}, Lon: {float(lon_val):.6f}" if lat_val is not None and lon_val is not None else "Lat/Lon: n/a"
-    postal_part = ""
-    if postal_col and postal_col in row and pd.notna(row[postal_col]):
-        postal_part = f"\nPostal: {row[postal_col]}"
-    return f"{name_part}{latlon_part}{postal_part}"
-
-def add_layer(df, color, layer_name, cluster=True, fast=False, postal_col=None, name_col=None):
+    return (
+        _optional_field(df, name_col, suffix="\n")
+        + "Lat: " + df[LAT_TEXT] + ", Lon: " + df[LON_TEXT]
+        + _optional_field(df, postal_col, "\nPostal: ")
+    )
+
+# No coverage hulls and a wider radius keep cluster counts down; chunkedLoading adds markers
+# in non-blocking batches so large layers don't freeze the page while loading.
+CLUSTER_OPTIONS = {'maxClusterRadius':80,'spiderfyOnMaxZoom':True,'showCoverageOnHover':False,'zoomToBoundsOnClick':True,
+                   'chunkedLoading':True,'chunkInterval':200,'chunkDelay':50}
+
+def marker_callback(color):
+    """
+    MarkerLayer callback for [lat, lon, tooltip, popup] rows.
+    The colored house icon is created once and shared by every marker.
+    """
+    return f"""
+    (function () {{
+        var icon = L.AwesomeMarkers.icon({{icon: "home", prefix: "fa", markerColor: "{color}"}});
+        return function (row) {{
+            var marker = L.marker(new L.LatLng(row[0], row[1]), {{icon: icon}});
+            marker.bindTooltip(row[2], {{sticky: true}});
+            marker.bindPopup(row[3], {{maxWidth: 320}});
+            return marker;
+        }};
+    }})()"""
+
+PLAIN_MARKER_CALLBACK = "function (row) { return L.marker(new L.LatLng(row[0], row[1])); }"
+
+def dumps_compact(obj):
+    """Compact JSON, via orjson when installed (which also serializes NumPy arrays natively)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    if isinstance(obj, np.ndarray):
+        obj = obj.tolist()
+    return json.dumps(obj, separators=(",", ":"))
+
+class MarkerData(MacroElement):
+    """Marker rows serialized to JSON once; every MarkerLayer drawn from them references the same array."""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = {{ this.json }};
+        {% endmacro %}
+    """)
+
+    def __init__(self, rows):
+        super().__init__()
+        self._name = "MarkerData"
+        # "</" is escaped so popup HTML can never close the surrounding <script>
+        self.json = dumps_compact(rows).replace("</", "<\\/")
+
+class MarkerLayer(JSCSSMixin, MacroElement):
+    """
+    Markers built client-side by a JS callback from a MarkerData array, in one script instead of
+    one Jinja-rendered folium.Marker per row. With cluster_options they go through a
+    markerClusterGroup, otherwise straight onto the parent layer.
+    Nothing is built until the parent layer is first shown, so a hidden view costs no marker work.
+    With a sibling layer, showing the parent hides the sibling, so the two views toggle.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var callback = {{ this.callback }};
+            var parent = {{ this._parent.get_name() }};
+            var fill = function () {
+                var markers = {{ this.data.get_name() }}.map(function (row) { return callback(row); });
+                {%- if this.cluster_options is not none %}
+                L.markerClusterGroup({{ this.cluster_options|tojson }}).addLayers(markers).addTo(parent);
+                {%- else %}
+                L.featureGroup(markers).addTo(parent);
+                {%- endif %}
+            };
+            if (parent._map) { fill(); } else { parent.once("add", fill); }
+            {%- if this.sibling is not none %}
+            // Deferred so the layer control has left its click handler and refreshes the sibling's checkbox
+            parent.on("add", function () {
+                setTimeout(function () {
+                    var sibling = {{ this.sibling.get_name() }};
+                    if (sibling._map) { sibling._map.removeLayer(sibling); }
+                }, 0);
+            });
+            {%- endif %}
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, data, callback, cluster_options=None, sibling=None):
+        super().__init__()
+        self._name = "MarkerLayer"
+        self.data = data
+        self.callback = callback
+        self.cluster_options = cluster_options
+        self.sibling = sibling
+
+def add_layers(m, df, color, layer_name, cluster=True, fast=False, postal_col=None, name_col=None):
     """
-    When fast=True -> FastMarkerCluster (very fast, but no custom icon/popup on spiderfy and no tooltips).
-    When fast=False -> MarkerCluster with colored house icons + popups/tooltips.
+    Add a clustered and an unclustered FeatureGroup for df to m. They are mutually exclusive:
+    ticking one in the LayerControl hides the other, client-side; `cluster` only picks which
+    one is shown initially.
+    Both are drawn from a single MarkerData payload.
+    When fast=True -> plain markers (very fast, but no custom icon/popup on spiderfy and no tooltips).
+    When fast=False -> colored house icons + popups/tooltips via marker_callback.
     """
-    layer = folium.FeatureGroup(name=layer_name, overlay=True, control=True)
+    clustered = folium.FeatureGroup(name=layer_name, overlay=True, control=True, show=cluster).add_to(m)
+    plain = folium.FeatureGroup(name=f"{layer_name} — unclustered", overlay=True, control=True,
+                                show=not cluster).add_to(m)
     if df.empty:
-        return layer
+        return
 
-    if cluster and fast:
-        pts = df[["latitude","longitude"]].to_numpy().tolist()
-        FastMarkerCluster(pts, name=f"{layer_name} Fast").add_to(layer)
-        return layer
+    if fast:
+        # orjson needs a C-contiguous array; the 6-decimal float64 values serialize the same either way
+        rows = np.ascontiguousarray(np.column_stack([payload_coords(df[LAT_TEXT]), payload_coords(df[LON_TEXT])]))
+        callback = PLAIN_MARKER_CALLBACK
+    else:
+        tips = tooltip_text(df, postal_col, name_col)
+        pops = popup_html(df, postal_col, name_col)
+        rows = list(zip(payload_coords(df[LAT_TEXT]).tolist(), payload_coords(df[LON_TEXT]).tolist(),
+                        tips.tolist(), pops.tolist()))
+        callback = marker_callback(color)
+    # Added to the map ahead of the layers so the array is defined before they read it
+    data = MarkerData(rows)
+    m.add_child(data, index=0)
+    MarkerLayer(data, callback, cluster_options=CLUSTER_OPTIONS, sibling=plain).add_to(clustered)
+    MarkerLayer(data, callback, sibling=clustered).add_to(plain)
 
-    # Normal cluster path (preserves icon colors and popups/tooltips)
-    cl = MarkerCluster(
-        name=f"{layer_name} Clusters", overlay=True, control=False,
-        options={'maxClusterRadius':50,'spiderfyOnMaxZoom':True,'showCoverageOnHover':True,'zoomToBoundsOnClick':True}
-    )
-    layer.add_child(cl)
-    for i, r in df.iterrows():
-        folium.Marker(
-            [r["latitude"], r["longitude"]],
-            tooltip=folium.Tooltip(tooltip_text(r, postal_col, name_col, i+1), sticky=True),
-            popup=folium.Popup(popup_html(r, postal_col, name_col), max_width=320),
-            icon=folium.Icon(color=color, icon="home", prefix="fa")  # colored house icon
-        ).add_to(cl)
-    return layer
+MAX_MARKERS = 5000
+
+def sample_markers(df, limit=MAX_MARKERS):
+    """Uniform, deterministic sample of at most `limit` rows to draw; metrics keep using the full frame."""
+    return df if len(df) <= limit else df.sample(n=limit, random_state=0)
+
+@st.cache_resource(show_spinner=False, hash_funcs={UploadedFile: upload_cache_key})
+def sampled_csv(file, limit=MAX_MARKERS):
+    """sample_markers over parse_csv's frame, cached per upload so reruns don't resample it."""
+    return sample_markers(parse_csv(file)[0], limit)
 
 def build_map(csv1, csv2, cluster=True, fast_csv=False,
               postal1=None, postal2=None, name1=None, name2=None):
     if csv1.empty and csv2.empty:
         return folium.Map(location=[20,0], zoom_start=2)
-    base = pd.concat(
-        [csv1[["latitude","longitude"]]] if not csv1.empty else [] +
-        [csv2[["latitude","longitude"]]] if not csv2.empty else [],
-        ignore_index=True
-    )
-    m = folium.Map(location=[base["latitude"].mean(), base["longitude"].mean()], zoom_start=9)
+    center = [combined_mean("latitude", csv1, csv2), combined_mean("longitude", csv1, csv2)]
+    m = folium.Map(location=center, zoom_start=9)
 
     # URL Data = GREEN, Store Data = BLUE
-    add_layer(csv1, "green", "URL Data (Green)",  cluster, fast_csv, postal1, name1).add_to(m)
-    add_layer(csv2, "blue",  "Store Data (Blue)", cluster, fast_csv, postal2, name2).add_to(m)
+    add_layers(m, csv1, "green", "URL Data (Green)",  cluster, fast_csv, postal1, name1)
+    add_layers(m, csv2, "blue",  "Store Data (Blue)", cluster, fast_csv, postal2, name2)
 
     folium.plugins.Fullscreen(position='topright').add_to(m)
     folium.LayerControl(collapsed=False).add_to(m)
     return m
 
+# Each entry is a full map document (several MB for big files), so keep only recent ones
+@st.cache_data(show_spinner=False, max_entries=8)
+def render_map_html(csv1, csv2, cluster=True, fast_csv=False,
+                    postal1=None, postal2=None, name1=None, name2=None):
+    """Build and render the map once per data/settings combination; reruns reuse the HTML."""
+    m = build_map(csv1, csv2, cluster=cluster, fast_csv=fast_csv,
+                  postal1=postal1, postal2=postal2, name1=name1, name2=name2)
+    return m.get_root().render()
+
 # ---------------- App ----------------
 def main():
     st.markdown('<h1 class="main-header">🌍 Location Visualizer — URL Data (Green) & Store Data (Blue)</h1>', unsafe_allow_html=True)
@@ -154,16 +355,28 @@ def main():
             up2 = st.file_uploader("Store Data (CSV)", type=["csv"], key="csv2")
 
         st.header("⚙️ Map Settings")
-        cluster = st.checkbox("Cluster locations", value=True)
+        cluster = st.checkbox(
+            "Cluster locations",
+            value=True,
+            help="Initial layer choice; the map's layer control switches between clustered and unclustered views."
+        )
         fast_csv = st.checkbox(
-            "High-speed for large CSVs (FastMarkerCluster)",
+            "High-speed for large CSVs (plain markers)",
             value=False,
             help="Much faster for big files. Disables custom icons/popups/tooltips on spiderfy."
         )
+        limit_markers = st.checkbox(
+            f"Limit map to {MAX_MARKERS:,} markers per CSV",
+            value=True,
+            help="Larger files are drawn from a uniform random sample. Metrics and charts still use every row."
+        )
 
     # Parse CSVs
-    csv1, c1_ok, c1_bad, postal1, name1, _, _ = parse_csv(up1) if up1 else (pd.DataFrame(),0,0,None,None,None,None)
-    csv2, c2_ok, c2_bad, postal2, name2, _, _ = parse_csv(up2) if up2 else (pd.DataFrame(),0,0,None,None,None,None)
+    no_csv = (pd.DataFrame(),0,0,None,None,None,None,pd.Series(dtype="int64"))
+    csv1, c1_ok, c1_bad, postal1, name1, _, _, postal_counts1 = parse_csv(up1) if up1 else no_csv
+    csv2, c2_ok, c2_bad, postal2, name2, _, _, postal_counts2 = parse_csv(up2) if up2 else no_csv
+    # Summed in first-appearance order (URL Data, then Store Data), as value_counts over both would see them
+    postal_counts = pd.concat([postal_counts1, postal_counts2]).groupby(level=0, sort=False).sum().astype("int64")
 
     # Metrics
     total = len(csv1) + len(csv2)
@@ -171,46 +384,41 @@ def main():
     with m1: st.metric("Total Locations", f"{total:,}")
     with m2:
         if total:
-            lat_all = pd.concat([s for s in [csv1.get("latitude"), csv2.get("latitude")] if s is not None], ignore_index=True)
-            st.metric("Avg Latitude", f"{lat_all.mean():.6f}")
+            st.metric("Avg Latitude", f"{combined_mean('latitude', csv1, csv2):.6f}")
         else: st.metric("Avg Latitude", "—")
     with m3:
         if total:
-            lon_all = pd.concat([s for s in [csv1.get("longitude"), csv2.get("longitude")] if s is not None], ignore_index=True)
-            st.metric("Avg Longitude", f"{lon_all.mean():.6f}")
+            st.metric("Avg Longitude", f"{combined_mean('longitude', csv1, csv2):.6f}")
         else: st.metric("Avg Longitude", "—")
     with m4:
-        any_postal = postal1 or postal2
-        if any_postal:
-            series_list = []
-            if postal1 and postal1 in csv1.columns: series_list.append(csv1[postal1])
-            if postal2 and postal2 in csv2.columns: series_list.append(csv2[postal2])
-            if series_list:
-                st.metric("Unique Postal Codes", pd.concat(series_list, ignore_index=True).nunique(dropna=True))
-            else:
-                st.metric("Unique Postal Codes", "0")
+        if postal1 or postal2:
+            st.metric("Unique Postal Codes", len(postal_counts))
         else:
             st.metric("Unique Postal Codes", "Not found")
 
     # Map (full width)
     st.markdown("### 📍 Map (Green = URL Data, Blue = Store Data)")
     with st.spinner("Rendering map..."):
-        fmap = build_map(
-            csv1, csv2, cluster=cluster, fast_csv=fast_csv,
+        map1 = sampled_csv(up1) if up1 and limit_markers else csv1
+        map2 = sampled_csv(up2) if up2 and limit_markers else csv2
+        map_html = render_map_html(
+            map1, map2, cluster=cluster, fast_csv=fast_csv,
             postal1=postal1, postal2=postal2, name1=name1, name2=name2
         )
-    st_folium(fmap, width=None, height=640, returned_objects=[])
+    if hasattr(st, "iframe"):
+        st.iframe(map_html, height=640)
+    else:  # Streamlit releases before st.iframe
+        components.html(map_html, height=640)
+    if len(map1) + len(map2) < total:
+        st.caption(f"Showing {len(map1) + len(map2):,} of {total:,} locations (sampled). "
+                   "Untick the marker limit in the sidebar to draw all of them.")
 
     # Postal Code summary (bar graph)
     st.markdown("### 🧭 Postal Code Summary")
     if postal1 or postal2:
-        series = []
-        if postal1 and postal1 in csv1.columns: series.append(csv1[postal1].dropna().astype(str))
-        if postal2 and postal2 in csv2.columns: series.append(csv2[postal2].dropna().astype(str))
-        if series:
-            combined = pd.concat(series, ignore_index=True)
-            counts = combined.value_counts().head(20)  # top 20
-            st.bar_chart(counts)
+        if not postal_counts.empty:
+            # stable sort keeps ties in first-appearance order, like value_counts
+            st.bar_chart(postal_counts.sort_values(ascending=False, kind="stable").head(20))  # top 20
         else:
             st.info("No postal codes detected in the uploaded files.")
     else:
@@ -220,13 +428,13 @@ def main():
     with st.expander("📊 URL Data (valid rows)"):
         if not csv1.empty:
             st.write(f"✅ Valid: {c1_ok:,} | ❌ Invalid: {c1_bad:,}")
-            st.dataframe(csv1.head(25), use_container_width=True)
+            st.dataframe(csv1.head(25).drop(columns=[LAT_TEXT, LON_TEXT]), use_container_width=True)
         else:
             st.info("No valid rows in URL Data.")
     with st.expander("📊 Store Data (valid rows)"):
         if not csv2.empty:
             st.write(f"✅ Valid: {c2_ok:,} | ❌ Invalid: {c2_bad:,}")
-            st.dataframe(csv2.head(25), use_container_width=True)
+            st.dataframe(csv2.head(25).drop(columns=[LAT_TEXT, LON_TEXT]), use_container_width=True)
         else:
             st.info("No valid rows in Store Data.")
 